@@ -4,26 +4,83 @@ Mail system MCP server for agent communication.
 Simple JSON file-based mail exchange.
 """
 
+import heapq
 import json
+import mmap
 import uuid
 import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
+from urllib.parse import quote
 
+import orjson
 from fastmcp import FastMCP
 
 # Configuration
-MAIL_DIR = Path("/workspaces/.mail")
+MAIL_DIR = Path(os.environ.get("MAIL_DIR", "/workspaces/.mail"))
 MAIL_DIR.mkdir(exist_ok=True)
+# Plain string paths are built by concatenation, avoiding Path parsing on hot paths
+MAIL_DIR_STR = str(MAIL_DIR)
+
+# Opening and mapping files releases the GIL, so threads overlap the filesystem waits
+READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+READ_POOL = ThreadPoolExecutor(max_workers=READ_WORKERS)
+# Directory scans keep at most this many reads in flight
+READ_WINDOW = READ_WORKERS * 2
+
+# Parsed messages by file path, valid while the file's (mtime_ns, size) is unchanged.
+# The flag records whether the body was parsed too. Least recently used entries are
+# evicted beyond MESSAGE_CACHE_SIZE; the lock guards access from READ_POOL threads.
+MESSAGE_CACHE_SIZE = 4096
+MESSAGE_CACHE: "OrderedDict[str, Tuple[Tuple[int, int], Dict, bool]]" = OrderedDict()
+MESSAGE_CACHE_LOCK = threading.Lock()
 
 # Create MCP server
 mcp = FastMCP("Agent Mail System")
 
 
-def get_message_path(message_id: str) -> Path:
+def cache_get(path: str) -> Optional[Tuple[Tuple[int, int], Dict, bool]]:
+    """Look up a cached message, marking it as recently used."""
+    with MESSAGE_CACHE_LOCK:
+        cached = MESSAGE_CACHE.get(path)
+        if cached:
+            MESSAGE_CACHE.move_to_end(path)
+        return cached
+
+
+def cache_put(path: str, entry: Tuple[Tuple[int, int], Dict, bool]) -> None:
+    """Cache a message, evicting the least recently used beyond MESSAGE_CACHE_SIZE."""
+    with MESSAGE_CACHE_LOCK:
+        MESSAGE_CACHE[path] = entry
+        MESSAGE_CACHE.move_to_end(path)
+        while len(MESSAGE_CACHE) > MESSAGE_CACHE_SIZE:
+            MESSAGE_CACHE.popitem(last=False)
+
+
+def cache_discard(path: str) -> None:
+    """Drop a message from the cache."""
+    with MESSAGE_CACHE_LOCK:
+        MESSAGE_CACHE.pop(path, None)
+
+
+def get_message_path(message_id: str) -> str:
     """Get the file path for a message."""
-    return MAIL_DIR / f"msg_{message_id}.json"
+    return f"{MAIL_DIR_STR}/msg_{message_id}.json"
+
+
+def get_inbox_index_path(agent: str) -> str:
+    """
+    Get the file path for an agent's inbox index.
+
+    Agent names are arbitrary strings, so they are percent-encoded to keep
+    characters like "/" from reaching the filesystem.
+    """
+    return f"{MAIL_DIR_STR}/inbox_{quote(agent, safe='')}.idx"
 
 
 def generate_message_id() -> str:
@@ -31,41 +88,235 @@ def generate_message_id() -> str:
     return str(uuid.uuid4())
 
 
+def dump_json(obj: Dict) -> bytes:
+    """
+    Serialize to compact JSON.
+
+    orjson rejects strings with lone surrogates; the standard library
+    escapes them as \\udXXX instead, so those messages fall back to it.
+    """
+    try:
+        return orjson.dumps(obj)
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def load_json(data: memoryview) -> Dict:
+    """
+    Parse JSON, falling back to the standard library for \\udXXX escapes.
+
+    Raises:
+        ValueError: If the data is not valid JSON.
+    """
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(bytes(data))
+
+
+def write_all(fd: int, data: bytes) -> None:
+    """Write all of `data` to `fd`, retrying after short writes."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
 def save_message(message: Dict) -> None:
-    """Save a message to disk."""
+    """
+    Save a message to disk.
+
+    The file holds two lines of compact JSON: every field except the body,
+    then {"body": ...}. Listing messages only needs to parse the first line.
+
+    The message is written and fsynced to a temporary file that is then
+    renamed over the destination, so readers never see a partially written
+    message, even after a crash.
+    """
     message_path = get_message_path(message["id"])
-    with open(message_path, "w") as f:
-        json.dump(message, f, indent=2)
+    tmp_path = f"{message_path}.{os.getpid()}.tmp"
+    headers = {key: value for key, value in message.items() if key != "body"}
+    data = b"%s\n%s\n" % (dump_json(headers), dump_json({"body": message["body"]}))
+    cache_discard(message_path)
+
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        write_all(fd, data)
+        os.fsync(fd)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, message_path)
+
+    # Persist the rename itself
+    dir_fd = os.open(MAIL_DIR_STR, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+# Start of the second line of a message file, as written by save_message
+BODY_PREFIX = b'{"body":'
 
 
 def load_message(message_id: str) -> Optional[Dict]:
     """Load a message from disk."""
-    message_path = get_message_path(message_id)
-    if not message_path.exists():
-        return None
+    return load_message_file(get_message_path(message_id))
+
+
+def load_message_headers(message_id: str) -> Optional[Dict]:
+    """Load a message from disk without its body."""
+    return load_message_file(get_message_path(message_id), headers_only=True)
+
+
+def read_message_file(path: str, headers_only: bool = False) -> Dict:
+    """
+    Parse a message file directly from a read-only memory mapping.
 
+    With `headers_only` parsing stops at the end of the header line. A file
+    is in the two-line format only if its second line starts with the body
+    object; anything else (e.g. the older single JSON document, indented or
+    not) is parsed whole.
+
+    Raises:
+        ValueError: If the file is empty or not valid JSON.
+    """
+    fd = os.open(path, os.O_RDONLY)
     try:
-        with open(message_path, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return None
+        with mmap.mmap(fd, 0, prot=mmap.PROT_READ) as mm, memoryview(mm) as view:
+            header_end = mm.find(b"\n")
+            body_start = header_end + 1
+            body_prefix = mm[body_start : body_start + len(BODY_PREFIX)]
+            if header_end < 0 or body_prefix != BODY_PREFIX:
+                # Older format: a single JSON document
+                message = load_json(view)
+                if headers_only:
+                    message.pop("body", None)
+                return message
+
+            message = load_json(view[:header_end])
+            if not headers_only:
+                message.update(load_json(view[body_start:]))
+            return message
+    finally:
+        os.close(fd)
+
+
+def load_message_file(path: str, headers_only: bool = False) -> Optional[Dict]:
+    """
+    Load a message file, returning None if it is missing or corrupted.
 
+    Parsed messages are cached until the file's mtime or size changes, so
+    repeated inbox and read calls skip re-parsing. Callers get a copy and
+    may modify it freely.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        cache_discard(path)
+        return None
 
-def list_messages() -> List[Dict]:
-    """List all messages in the mail directory."""
-    messages = []
-    for file_path in MAIL_DIR.glob("msg_*.json"):
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = cache_get(path)
+    if cached and cached[0] == version and (headers_only or cached[2]):
+        message = dict(cached[1])
+    else:
         try:
-            with open(file_path, "r") as f:
-                message = json.load(f)
-                messages.append(message)
-        except (json.JSONDecodeError, IOError):
-            # Skip corrupted files
-            continue
+            message = read_message_file(path, headers_only)
+        except (ValueError, OSError):
+            return None
+        cache_put(path, (version, message, not headers_only))
+        message = dict(message)
+
+    if headers_only:
+        message.pop("body", None)
+    return message
 
-    # Sort by timestamp (newest first)
-    messages.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    return messages
+
+def newest_first(messages: Iterable[Dict], limit: Optional[int] = None) -> List[Dict]:
+    """
+    Order messages by timestamp, newest first.
+
+    With a limit only the newest `limit` messages are kept, selected with a
+    heap instead of sorting everything.
+    """
+    if limit is None:
+        return sorted(messages, key=lambda x: x.get("timestamp", ""), reverse=True)
+    return heapq.nlargest(limit, messages, key=lambda x: x.get("timestamp", ""))
+
+
+def iter_messages() -> Iterator[Dict]:
+    """
+    Yield all messages in the mail directory without bodies, in no particular order.
+
+    Files are loaded on READ_POOL with at most READ_WINDOW reads in flight, so
+    memory held by pending results stays bounded however many messages exist.
+    """
+    load = partial(load_message_file, headers_only=True)
+    pending: "deque[Future[Optional[Dict]]]" = deque()
+    with os.scandir(MAIL_DIR_STR) as entries:
+        for entry in entries:
+            if not (entry.name.startswith("msg_") and entry.name.endswith(".json")):
+                continue
+            pending.append(READ_POOL.submit(load, entry.path))
+            if len(pending) >= READ_WINDOW:
+                message = pending.popleft().result()
+                # Skip corrupted files
+                if message:
+                    yield message
+
+    while pending:
+        message = pending.popleft().result()
+        if message:
+            yield message
+
+
+def list_messages(limit: Optional[int] = None) -> List[Dict]:
+    """List messages (without bodies) in the mail directory, newest first, up to `limit`."""
+    return newest_first(iter_messages(), limit)
+
+
+def append_inbox_index(agent: str, lines: List[str]) -> None:
+    """
+    Append entries to an agent's inbox index.
+
+    Each entry is one line: a message ID, or a "-" prefixed ID marking
+    the message as deleted. Appends keep concurrent writers safe without
+    rewriting the file, and are fsynced before returning.
+    """
+    fd = os.open(get_inbox_index_path(agent), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        write_all(fd, "".join(f"{line}\n" for line in lines).encode())
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def load_inbox_index(agent: str) -> List[str]:
+    """
+    Load the message IDs in an agent's inbox.
+
+    The index is built from a full directory scan the first time an agent's
+    inbox is requested, e.g. for messages sent before indexing existed.
+    """
+    index_path = get_inbox_index_path(agent)
+    try:
+        with open(index_path, "r") as f:
+            lines = f.read().split()
+    except FileNotFoundError:
+        lines = [m["id"] for m in iter_messages() if agent in m.get("to", [])]
+        append_inbox_index(agent, lines)
+
+    # Replay additions and deletions in order, dropping duplicates
+    message_ids: Dict[str, None] = {}
+    for line in lines:
+        if line.startswith("-"):
+            message_ids.pop(line[1:], None)
+        else:
+            message_ids[line] = None
+    return list(message_ids)
 
 
 @mcp.tool()
@@ -95,35 +346,44 @@ def mcp__mail_send(from_agent: str, to_agents: List[str], subject: str, body: st
         "read": False,
     }
 
+    # Index before saving: a crash in between leaves an ID without a message,
+    # which the inbox skips, rather than a message missing from the index
+    for agent in set(to_agents):
+        if not os.path.exists(get_inbox_index_path(agent)):
+            # Build the index from existing mail before the first append
+            load_inbox_index(agent)
+        append_inbox_index(agent, [message_id])
+
     save_message(message)
     return message_id
 
 
 @mcp.tool()
-def mcp__mail_inbox(to_agent: str) -> List[Dict]:
+def mcp__mail_inbox(to_agent: str, limit: int = 100) -> List[Dict]:
     """
     Get inbox summary for an agent.
 
     Args:
         to_agent: Name of the agent to get inbox for
+        limit: Maximum number of messages to return (newest first)
 
     Returns:
         List of message summaries (without body content)
     """
-    all_messages = list_messages()
+    message_ids = load_inbox_index(to_agent)
+    messages = [message for message in READ_POOL.map(load_message_headers, message_ids) if message]
     inbox = []
 
-    for message in all_messages:
-        if to_agent in message.get("to", []):
-            # Return summary without body for performance
-            summary = {
-                "id": message["id"],
-                "from": message["from"],
-                "subject": message["subject"],
-                "timestamp": message["timestamp"],
-                "read": message.get("read", False),
-            }
-            inbox.append(summary)
+    for message in newest_first(messages, limit):
+        # Return summary without body for performance
+        summary = {
+            "id": message["id"],
+            "from": message["from"],
+            "subject": message["subject"],
+            "timestamp": message["timestamp"],
+            "read": message.get("read", False),
+        }
+        inbox.append(summary)
 
     return inbox
 
@@ -143,9 +403,10 @@ def mcp__mail_read(message_id: str) -> Dict:
     if not message:
         return {"error": f"Message {message_id} not found"}
 
-    # Mark as read
-    message["read"] = True
-    save_message(message)
+    # Mark as read, skipping the write if it already is
+    if not message.get("read"):
+        message["read"] = True
+        save_message(message)
 
     return message
 
@@ -162,25 +423,36 @@ def mcp__mail_delete(message_id: str) -> bool:
         True if deleted successfully, False otherwise
     """
     message_path = get_message_path(message_id)
-    if not message_path.exists():
-        return False
+    # Corrupted messages are still deleted; the inbox already skips their IDs
+    message = load_message_headers(message_id)
 
     try:
-        message_path.unlink()
-        return True
+        os.unlink(message_path)
     except OSError:
         return False
+    cache_discard(message_path)
+
+    if message:
+        for agent in set(message.get("to", [])):
+            # Without an index the next rebuild won't see the deleted file anyway,
+            # and creating one here would hide the agent's older unindexed mail
+            if os.path.exists(get_inbox_index_path(agent)):
+                append_inbox_index(agent, [f"-{message_id}"])
+    return True
 
 
 @mcp.tool()
-def mcp__mail_list_all() -> List[Dict]:
+def mcp__mail_list_all(limit: int = 100) -> List[Dict]:
     """
     List all messages in the system (for debugging).
 
+    Args:
+        limit: Maximum number of messages to return (newest first)
+
     Returns:
         List of all messages with summaries
     """
-    messages = list_messages()
+    messages = list_messages(limit)
     summaries = []
 
     for message in messages:
@@ -208,19 +480,14 @@ This directory contains JSON files for agent communication.
 
 ## Structure
 - `msg_<uuid>.json` - Individual mail messages
+- `inbox_<agent>.idx` - Per-agent inbox index (one message ID per line, agent name percent-encoded)
 - `README.md` - This file
 
 ## Message Format
+Each message file holds two lines of JSON: the header fields, then the body.
 ```json
-{
-  "id": "msg_<uuid4>",
-  "from": "agent-name",
-  "to": ["recipient1", "recipient2"],
-  "subject": "Task update",
-  "body": "Message content here",
-  "timestamp": "2024-07-03T10:30:00Z",
-  "read": false
-}
+{"id": "<uuid4>", "from": "agent-name", "to": ["recipient1", "recipient2"], "subject": "Task update", "timestamp": "2024-07-03T10:30:00Z", "read": false}
+{"body": "Message content here"}
 ```
 
 ## Usage
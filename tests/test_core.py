@@ -1,30 +1,35 @@
 """Tests for example.core module."""
 
+from typing import Optional
+
 import pytest
 
 from example.core import add, divide
 
 
-class TestAdd:
-    """Test add function."""
-    
-    def test_add_integers(self) -> None:
-        """Test adding two integers."""
-        assert add(2, 3) == 5
-    
-    def test_add_floats(self) -> None:
-        """Test adding floats."""
-        assert add(2.5, 3.5) == 6.0
+@pytest.mark.parametrize(
+    ("a", "b", "expected"),
+    [
+        (2, 3, 5),
+        (2.5, 3.5, 6.0),
+    ],
+)
+def test_add(a: float, b: float, expected: float) -> None:
+    """Test adding integers and floats."""
+    assert add(a, b) == expected
 
 
-class TestDivide:
-    """Test divide function."""
-    
-    def test_divide_integers(self) -> None:
-        """Test dividing integers."""
-        assert divide(10, 2) == 5.0
-    
-    def test_divide_by_zero_raises(self) -> None:
-        """Test that dividing by zero raises ValueError."""
-        with pytest.raises(ValueError, match="Cannot divide by zero"):
-            divide(10, 0)
\ No newline at end of file
+@pytest.mark.parametrize(
+    ("a", "b", "expected", "raises"),
+    [
+        (10, 2, 5.0, None),
+        (10, 0, None, "Cannot divide by zero"),
+    ],
+)
+def test_divide(a: float, b: float, expected: Optional[float], raises: Optional[str]) -> None:
+    """Test dividing numbers, including that dividing by zero raises ValueError."""
+    if raises:
+        with pytest.raises(ValueError, match=raises):
+            divide(a, b)
+    else:
+        assert divide(a, b) == expected
@@ -0,0 +1,231 @@
+"""Tests for the mail MCP server (scripts/mcp-servers/mcp_mail.py)."""
+
+import importlib.util
+import inspect
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+pytest.importorskip("fastmcp")
+pytest.importorskip("orjson")
+
+MAIL_SERVER_PATH = Path(__file__).parent.parent / "scripts" / "mcp-servers" / "mcp_mail.py"
+
+# Saved directly, as mail sent before inbox indexing existed would be
+UNINDEXED_MESSAGE = {
+    "id": "legacy",
+    "from": "alice",
+    "to": ["bob"],
+    "subject": "Before indexing",
+    "body": "Body",
+    "timestamp": "2024-01-01T00:00:00Z",
+    "read": False,
+}
+
+
+@pytest.fixture(scope="module")
+def mail_module(tmp_path_factory) -> ModuleType:
+    """Import the mail server with MAIL_DIR pointing at a temporary directory"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("MAIL_DIR", str(tmp_path_factory.mktemp("mail")))
+        spec = importlib.util.spec_from_file_location("mcp_mail", MAIL_SERVER_PATH)
+        assert spec and spec.loader
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def mail(mail_module, tmp_path, monkeypatch) -> ModuleType:
+    """Mail server using an empty mail directory for each test"""
+    monkeypatch.setattr(mail_module, "MAIL_DIR", tmp_path)
+    monkeypatch.setattr(mail_module, "MAIL_DIR_STR", str(tmp_path))
+    mail_module.MESSAGE_CACHE.clear()
+    return mail_module
+
+
+def test_send_adds_message_to_each_recipient_index(mail) -> None:
+    """Test that sending appends the message ID to every recipient's index."""
+    message_id = mail.mcp__mail_send("alice", ["bob", "carol"], "Hi", "Body")
+
+    assert mail.load_inbox_index("bob") == [message_id]
+    assert mail.load_inbox_index("carol") == [message_id]
+    assert [m["id"] for m in mail.mcp__mail_inbox("bob")] == [message_id]
+
+
+def test_delete_removes_message_from_index(mail) -> None:
+    """Test that deleting appends a tombstone that hides the message."""
+    kept = mail.mcp__mail_send("alice", ["bob"], "Keep", "Body")
+    deleted = mail.mcp__mail_send("alice", ["bob"], "Delete", "Body")
+
+    assert mail.mcp__mail_delete(deleted) is True
+    assert mail.load_inbox_index("bob") == [kept]
+    assert f"-{deleted}" in Path(mail.get_inbox_index_path("bob")).read_text().split()
+
+
+def test_missing_index_is_rebuilt(mail) -> None:
+    """Test that messages saved without an index are found by a directory scan."""
+    mail.save_message(dict(UNINDEXED_MESSAGE))
+
+    assert [m["id"] for m in mail.mcp__mail_inbox("bob")] == ["legacy"]
+    assert Path(mail.get_inbox_index_path("bob")).read_text().split() == ["legacy"]
+
+
+def test_first_send_rebuilds_index_before_appending(mail) -> None:
+    """Test that the first send to an agent keeps its earlier, unindexed mail."""
+    mail.save_message(dict(UNINDEXED_MESSAGE))
+    message_id = mail.mcp__mail_send("alice", ["bob"], "Hi", "Body")
+
+    assert sorted(mail.load_inbox_index("bob")) == sorted(["legacy", message_id])
+
+
+def test_delete_before_first_inbox_keeps_unindexed_mail(mail) -> None:
+    """Test that deleting for an agent without an index does not create one."""
+    mail.save_message(dict(UNINDEXED_MESSAGE))
+    mail.save_message({**UNINDEXED_MESSAGE, "id": "deleted"})
+
+    assert mail.mcp__mail_delete("deleted") is True
+    assert not Path(mail.get_inbox_index_path("bob")).exists()
+    assert [m["id"] for m in mail.mcp__mail_inbox("bob")] == ["legacy"]
+
+
+def test_duplicate_index_lines_are_collapsed(mail) -> None:
+    """Test that repeated IDs in the index are returned once, in first-seen order."""
+    Path(mail.get_inbox_index_path("bob")).write_text("a\nb\na\n-b\nb\n")
+
+    assert mail.load_inbox_index("bob") == ["a", "b"]
+
+
+def test_index_appended_before_message_is_saved(mail) -> None:
+    """Test that an indexed ID whose message was never saved is skipped."""
+    mail.append_inbox_index("bob", ["never-saved"])
+    message_id = mail.mcp__mail_send("alice", ["bob"], "Hi", "Body")
+
+    assert [m["id"] for m in mail.mcp__mail_inbox("bob")] == [message_id]
+
+
+def test_agent_names_are_encoded_in_index_path(mail, tmp_path) -> None:
+    """Test that agent names cannot create subpaths or escape the mail directory."""
+    message_id = mail.mcp__mail_send("alice", ["team/backend", "x/../.."], "Hi", "Body")
+
+    assert [m["id"] for m in mail.mcp__mail_inbox("team/backend")] == [message_id]
+    assert [m["id"] for m in mail.mcp__mail_inbox("x/../..")] == [message_id]
+    assert Path(mail.get_inbox_index_path("x/../..")).parent == tmp_path
+
+
+def test_delete_corrupted_message(mail, tmp_path) -> None:
+    """Test that messages that fail to parse can still be deleted."""
+    (tmp_path / "msg_bad.json").write_text("{truncated")
+
+    assert mail.mcp__mail_delete("bad") is True
+    assert not (tmp_path / "msg_bad.json").exists()
+    assert mail.mcp__mail_delete("bad") is False
+
+
+def test_message_cache_evicts_least_recently_used(mail, monkeypatch) -> None:
+    """Test that the parsed-message cache stays within MESSAGE_CACHE_SIZE."""
+    monkeypatch.setattr(mail, "MESSAGE_CACHE_SIZE", 2)
+    first, second, third = (mail.mcp__mail_send("alice", ["bob"], "Hi", "Body") for _ in range(3))
+
+    mail.load_message(first)
+    mail.load_message(second)
+    mail.load_message(first)
+    mail.load_message(third)
+
+    assert list(mail.MESSAGE_CACHE) == [
+        mail.get_message_path(first),
+        mail.get_message_path(third),
+    ]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        '{\n  "id": "old",\n  "from": "alice",\n  "to": ["bob"],\n  "subject": "Old",\n'
+        '  "body": "Line 1\\nLine 2",\n  "timestamp": "2024-01-01T00:00:00Z",\n  "read": false\n}',
+        '{"id": "old", "from": "alice", "to": ["bob"], "subject": "Old", '
+        '"body": "Line 1\\nLine 2", "timestamp": "2024-01-01T00:00:00Z", "read": false}\n',
+        '{\r\n  "id": "old", "from": "alice", "to": ["bob"], "subject": "Old",\r\n'
+        '  "body": "Line 1\\nLine 2", "timestamp": "2024-01-01T00:00:00Z", "read": false\r\n}\r\n',
+    ],
+    ids=["indented", "single-line", "crlf"],
+)
+def test_reads_old_format_messages(mail, tmp_path, content) -> None:
+    """Test that messages written as a single JSON document are still read."""
+    (tmp_path / "msg_old.json").write_text(content, newline="")
+
+    assert [m["subject"] for m in mail.mcp__mail_inbox("bob")] == ["Old"]
+    message = mail.mcp__mail_read("old")
+    assert message["body"] == "Line 1\nLine 2"
+    assert message["read"] is True
+    assert mail.mcp__mail_read("old")["body"] == "Line 1\nLine 2"
+
+
+def test_list_messages_beyond_read_window(mail, monkeypatch) -> None:
+    """Test that scans with more files than READ_WINDOW return every message."""
+    monkeypatch.setattr(mail, "READ_WINDOW", 2)
+    message_ids = {mail.mcp__mail_send("alice", ["bob"], "Hi", "Body") for _ in range(5)}
+
+    assert {m["id"] for m in mail.list_messages()} == message_ids
+
+
+def test_save_message_retries_short_writes(mail) -> None:
+    """Test that a short write does not leave a truncated message."""
+    real_write = mail.os.write
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(mail.os, "write", lambda fd, data: real_write(fd, bytes(data[:7])))
+        mail.save_message(dict(UNINDEXED_MESSAGE))
+
+    mail.MESSAGE_CACHE.clear()
+    assert mail.load_message("legacy") == UNINDEXED_MESSAGE
+
+
+def test_lone_surrogates_round_trip(mail) -> None:
+    """Test that strings orjson cannot encode are still sent and read."""
+    message_id = mail.mcp__mail_send("alice", ["bob"], "Bad \ud800", "Body \udc80")
+
+    assert [m["subject"] for m in mail.mcp__mail_inbox("bob")] == ["Bad \ud800"]
+    mail.MESSAGE_CACHE.clear()
+    assert mail.mcp__mail_read(message_id)["body"] == "Body \udc80"
+
+
+def test_reads_old_format_message_with_surrogate_escape(mail, tmp_path) -> None:
+    """Test that old files with \\udXXX escapes accepted by json are not skipped."""
+    (tmp_path / "msg_old.json").write_text(
+        '{"id": "old", "from": "alice", "to": ["bob"], "subject": "Old \\ud800", '
+        '"body": "Body", "timestamp": "2024-01-01T00:00:00Z", "read": false}'
+    )
+
+    assert [m["subject"] for m in mail.mcp__mail_inbox("bob")] == ["Old \ud800"]
+
+
+@pytest.mark.parametrize("tool", ["mcp__mail_inbox", "mcp__mail_list_all"])
+def test_listing_tools_return_newest_messages_up_to_limit(mail, tool) -> None:
+    """Test that the inbox and list-all tools truncate to the newest `limit` messages."""
+    for day in (3, 1, 5, 2, 4):
+        mail.save_message(
+            {**UNINDEXED_MESSAGE, "id": f"day{day}", "timestamp": f"2024-01-0{day}T00:00:00Z"}
+        )
+    list_tool = getattr(mail, tool)
+    args = ("bob",) if tool == "mcp__mail_inbox" else ()
+
+    assert [m["id"] for m in list_tool(*args, limit=3)] == ["day5", "day4", "day3"]
+    assert [m["id"] for m in list_tool(*args)] == ["day5", "day4", "day3", "day2", "day1"]
+    assert inspect.signature(list_tool).parameters["limit"].default == 100
+
+
+def test_rereading_message_does_not_rewrite_it(mail, monkeypatch) -> None:
+    """Test that only the first read marks a message as read on disk."""
+    message_id = mail.mcp__mail_send("alice", ["bob"], "Hi", "Body")
+    path = Path(mail.get_message_path(message_id))
+    assert mail.mcp__mail_read(message_id)["read"] is True
+    before = path.stat()
+
+    saved = []
+    monkeypatch.setattr(mail, "save_message", saved.append)
+    assert mail.mcp__mail_read(message_id)["read"] is True
+
+    assert saved == []
+    after = path.stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)